@@ -1,34 +1,30 @@
-import io
-import PyPDF2
+import fitz
 from reportlab.lib.pagesizes import A4
 
 def resize_pdf_to_a4(input_pdf, output_pdf):
-    with open(input_pdf, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        writer = PyPDF2.PdfWriter()
+    with fitz.open(input_pdf) as src, fitz.open() as out:
+        width, height = A4
         
-        for page_num in range(len(reader.pages)):
-            page = reader.pages[page_num]
-            width, height = A4
-            
-            original_width = float(page.mediabox.width)
-            original_height = float(page.mediabox.height)
+        for page in src:
+            original_width = page.rect.width
+            original_height = page.rect.height
             
             scale_x = width / original_width
             scale_y = height / original_height
             scale = min(scale_x, scale_y)
             
             # Create a new page with A4 size
-            new_page = PyPDF2.PageObject.create_blank_page(width=width, height=height)
-            
-            # Merge and scale the original page
-            new_page.merge_page(page)
-            new_page.scale_by(scale)
+            new_page = out.new_page(width=width, height=height)
             
-            writer.add_page(new_page)
+            # Place the original page scaled by a transformation matrix,
+            # without parsing its content stream
+            target = fitz.Rect(0, 0, original_width * scale, original_height * scale)
+            new_page.show_pdf_page(target, src, page.number)
         
-        with open(output_pdf, 'wb') as output_file:
-            writer.write(output_file)
+        # Let MuPDF drop unused objects, merge duplicates and compress
+        # streams while it writes
+        with open(output_pdf, 'wb', buffering=1 << 20) as output_file:
+            out.save(output_file, garbage=3, deflate=True)
 
 # Specific path usage
 resize_pdf_to_a4(r'D:\tools\lamaran_olinnns.PDF', r'D:\tools\output_a4.pdf')
\ No newline at end of file
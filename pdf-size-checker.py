@@ -1,7 +1,32 @@
 import PyPDF2
+from PyPDF2.generic import RectangleObject
 import math
 import os
 
+def _build_size_index(paper_sizes):
+    """
+    Build a lookup from rounded (width, height) in mm to matching paper sizes.
+    
+    Every size is indexed in both orientations with a tolerance of 1 mm on
+    each side, matching the "less than 2 mm off" rule on rounded dimensions.
+    
+    Args:
+        paper_sizes (dict): Paper size name -> (width, height) in mm
+    
+    Returns:
+        dict: (width, height) -> list of paper size names
+    """
+    index = {}
+    for size, (std_width, std_height) in paper_sizes.items():
+        keys = set()
+        for width, height in ((std_width, std_height), (std_height, std_width)):
+            for dw in (-1, 0, 1):
+                for dh in (-1, 0, 1):
+                    keys.add((width + dw, height + dh))
+        for key in keys:
+            index.setdefault(key, []).append(size)
+    return index
+
 class PaperSizeChecker:
     # Standard paper sizes in millimeters (width, height)
     PAPER_SIZES = {
@@ -23,6 +48,9 @@ class PaperSizeChecker:
         'Tabloid': (279, 432)
     }
 
+    # Precomputed O(1) lookup of PAPER_SIZES by rounded dimensions
+    _SIZE_INDEX = _build_size_index(PAPER_SIZES)
+
     @staticmethod
     def get_pdf_dimensions(file_path):
         """
@@ -35,20 +63,31 @@ class PaperSizeChecker:
             tuple: (width, height) of the first page in points
         """
         try:
-            with open(file_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
+            with open(file_path, 'rb', buffering=1 << 20) as file:
+                reader = PyPDF2.PdfReader(file, strict=False)
+                
+                # Walk /Root -> /Pages -> first /Kids down to the first page,
+                # resolving only the objects on that path instead of
+                # building the whole page list
+                node = reader.trailer["/Root"]["/Pages"]
+                mediabox = None
+                while True:
+                    # MediaBox may be inherited from an ancestor node
+                    if "/MediaBox" in node:
+                        mediabox = node["/MediaBox"]
+                    if "/Kids" not in node:
+                        break
+                    kids = node["/Kids"]
+                    if len(kids) == 0:
+                        return None
+                    node = kids[0].get_object()
                 
-                # Get the first page
-                if len(reader.pages) > 0:
-                    page = reader.pages[0]
-                    
-                    # Get page size in points
-                    width = page.mediabox.width
-                    height = page.mediabox.height
-                    
-                    return width, height
-                else:
+                if mediabox is None:
                     return None
+                
+                # Get page size in points
+                box = RectangleObject(mediabox)
+                return box.width, box.height
         except Exception as e:
             print(f"Error reading PDF: {e}")
             return None
@@ -81,14 +120,8 @@ class PaperSizeChecker:
         width_mm = round(width_mm)
         height_mm = round(height_mm)
         
-        matching_sizes = []
-        for size, (std_width, std_height) in self.PAPER_SIZES.items():
-            # Check both portrait and landscape orientations
-            if ((abs(width_mm - std_width) < 2 and abs(height_mm - std_height) < 2) or 
-                (abs(width_mm - std_height) < 2 and abs(height_mm - std_width) < 2)):
-                matching_sizes.append(size)
-        
-        return matching_sizes
+        # Both portrait and landscape orientations are in the index
+        return list(self._SIZE_INDEX.get((width_mm, height_mm), []))
 
     def analyze_pdf(self, file_path):
         """
@@ -3,12 +3,15 @@
 Exact 1MB PDF Resizer - Converts any PDF to exactly (or very close to) 1MB size
 """
 
+import io
 import os
 import sys
 import tempfile
 import shutil
 import math
 import argparse
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 from PyPDF2 import PdfReader, PdfWriter
 
 # Try to import optional dependencies
@@ -19,46 +22,101 @@ try:
 except ImportError:
     HAS_PIL = False
 
+try:
+    import fitz
+    HAS_FITZ = True
+except ImportError:
+    HAS_FITZ = False
+
+# Large buffer for PDF output so big files go out in few write() calls
+WRITE_BUFFER_SIZE = 1 << 20
+
+# Reference qualities and sample size for calibrating the page size model.
+# The search stays within these qualities, so predictions interpolate
+# between measurements instead of extrapolating past them.
+CALIBRATION_QUALITIES = (1, 50, 95)
+CALIBRATION_SAMPLE_SIZE = 8
+
+# Approximate img2pdf container overhead per page, in bytes
+PDF_PAGE_OVERHEAD = 2048
+
+# Upper bound on pages rendered per worker task when rasterizing a PDF
+RENDER_BATCH_SIZE = 16
+
 def get_size_mb(file_path):
     """Get file size in MB"""
     return os.path.getsize(file_path) / (1024 * 1024)
 
+def copy_file(src_path, dst_path):
+    """Copy a file using large buffered reads and writes"""
+    with open(src_path, "rb") as src, open(dst_path, "wb", buffering=WRITE_BUFFER_SIZE) as dst:
+        shutil.copyfileobj(src, dst, length=WRITE_BUFFER_SIZE)
+
+def write_file(path, data):
+    """Write in-memory file contents with a large output buffer"""
+    with open(path, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+        f.write(data)
+
+def _render_pages(args):
+    """Render a batch of PDF pages to raw RGB (PPM) files in a worker process
+
+    Returns (image path, pixel digest) per page. Pages whose pixels repeat
+    within the batch are written once and share the first page's file.
+    """
+    pdf_path, page_numbers, output_dir, dpi = args
+    zoom = dpi / 72
+    matrix = fitz.Matrix(zoom, zoom)
+    
+    rendered = []
+    seen = {}
+    with fitz.open(pdf_path) as doc:
+        for i in page_numbers:
+            pix = doc.load_page(i).get_pixmap(matrix=matrix, alpha=False)
+            # Include the size so equal-looking blank pages of different
+            # shapes are not merged
+            hasher = hashlib.blake2b(f"{pix.width}x{pix.height}".encode(), digest_size=16)
+            hasher.update(pix.samples)
+            digest = hasher.digest()
+            img_path = seen.get(digest)
+            if img_path is None:
+                # Lossless raw pixels, so the trial JPEG encode is the only lossy step
+                img_path = os.path.join(output_dir, f"page_{i+1:03d}.ppm")
+                pix.save(img_path)
+                seen[digest] = img_path
+            rendered.append((img_path, digest))
+    return rendered
+
 def convert_pdf_to_images(pdf_path, output_dir, dpi=150):
-    """Convert PDF to images using Pillow"""
-    if not HAS_PIL:
-        print("Error: Pillow and img2pdf are required for this operation.")
+    """Convert PDF to raw RGB page images using PyMuPDF, rendering page batches in parallel
+
+    Pages with identical pixels map to the same image file.
+    """
+    if not HAS_FITZ:
+        print("Error: PyMuPDF is required for this operation.")
         return []
     
     try:
-        # Try to use pdf2image which is more reliable for PDFs
-        try:
-            from pdf2image import convert_from_path
-            images = convert_from_path(pdf_path, dpi=dpi)
-            image_files = []
-            for i, img in enumerate(images):
-                img_path = os.path.join(output_dir, f"page_{i+1:03d}.jpg")
-                img.save(img_path, "JPEG")
-                image_files.append(img_path)
-            return image_files
-        except ImportError:
-            print("Warning: pdf2image not found. Using less reliable method.")
-            pass
+        with fitz.open(pdf_path) as doc:
+            page_count = len(doc)
+        if page_count == 0:
+            return []
         
-        # Fallback to direct PIL reading (less reliable)
-        from PIL import Image
-        images = []
-        i = 0
-        try:
-            pdf = Image.open(pdf_path)
-            while True:
-                img_path = os.path.join(output_dir, f"page_{i+1:03d}.jpg")
-                pdf.seek(i)
-                pdf.save(img_path, "JPEG")
-                images.append(img_path)
-                i += 1
-        except EOFError:
-            pass
-        return images
+        # MuPDF documents can't be shared between threads, so each worker
+        # process opens its own copy and renders a contiguous batch of pages
+        workers = min(os.cpu_count() or 1, page_count)
+        batch_size = min(RENDER_BATCH_SIZE, math.ceil(page_count / workers))
+        batches = [
+            (pdf_path, range(start, min(start + batch_size, page_count)), output_dir, dpi)
+            for start in range(0, page_count, batch_size)
+        ]
+        
+        image_files = []
+        first_file = {}
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for rendered in pool.map(_render_pages, batches):
+                for img_path, digest in rendered:
+                    image_files.append(first_file.setdefault(digest, img_path))
+        return image_files
     except Exception as e:
         print(f"Error converting PDF to images: {e}")
         return []
@@ -77,57 +135,122 @@ def compress_images(image_files, quality):
             return False
     return True
 
-def create_pdf_from_images(image_files, output_path):
-    """Create PDF from images"""
+def load_image(img_path):
+    """Open one page image and load its pixels"""
+    with Image.open(img_path) as img:
+        img.load()
+        return img.copy()
+
+def encode_image(img, quality):
+    """Encode an image to JPEG bytes at the given quality"""
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=quality, optimize=False)
+    return buf.getvalue()
+
+# Page image paths for the encoder pool, set up by _init_encoder
+_worker_files = []
+
+def _init_encoder(image_files):
+    """Pool initializer: remember the page image paths for this worker"""
+    global _worker_files
+    _worker_files = image_files
+
+def _encode_page(args):
+    """Load one raw page image and encode it to JPEG bytes
+
+    Pages are not cached: tasks are handed out dynamically, so a cache
+    would end up holding most of the document in every worker. Reloading
+    the raw PPM is cheap next to the JPEG encode.
+    """
+    index, quality = args
+    return encode_image(load_image(_worker_files[index]), quality)
+
+def sample_pages(page_order, sample_size):
+    """Pick evenly spaced pages, so calibration is the same on every run"""
+    count = min(sample_size, len(page_order))
+    step = len(page_order) / count
+    return [page_order[int(i * step)] for i in range(count)]
+
+def interpolate_size(points, quality):
+    """Interpolate size at quality from sorted (quality, bytes) points, linearly in log(size)"""
+    for (q1, s1), (q2, s2) in zip(points, points[1:]):
+        if quality <= q2:
+            break
+    t = (quality - q1) / (q2 - q1)
+    log_s1 = math.log(max(s1, 1))
+    log_s2 = math.log(max(s2, 1))
+    return math.exp(log_s1 + t * (log_s2 - log_s1))
+
+def predict_pdf_size_mb(points, sample_count, page_count, quality):
+    """Predict the img2pdf output size in MB from the sampled page sizes"""
+    page_bytes = interpolate_size(points, quality) * page_count / sample_count
+    return (page_bytes + PDF_PAGE_OVERHEAD * page_count) / (1024 * 1024)
+
+def predicted_quality(predict_size_mb, target_size_mb, min_quality, max_quality):
+    """Quality whose predicted output size is closest to the target"""
+    return min(range(min_quality, max_quality + 1),
+               key=lambda q: abs(predict_size_mb(q) - target_size_mb))
+
+def compress_pdf(input_path):
+    """Losslessly compress a PDF and return the new file contents"""
+    if HAS_FITZ:
+        # Drop unused objects, merge duplicates and deflate all streams
+        with fitz.open(input_path) as doc:
+            return doc.tobytes(garbage=4, deflate=True, clean=True)
+    
+    reader = PdfReader(input_path)
+    writer = PdfWriter()
+    
+    for page in reader.pages:
+        writer.add_page(page).compress_content_streams()
+    
+    if reader.metadata:
+        writer.add_metadata(reader.metadata)
+    
+    buf = io.BytesIO()
+    writer.write(buf)
+    return buf.getvalue()
+
+def create_pdf_from_images(page_jpegs):
+    """Create PDF bytes from in-memory JPEG page images"""
     if not HAS_PIL:
-        return False
+        return None
     
     try:
-        with open(output_path, "wb") as f:
-            f.write(img2pdf.convert(image_files))
-        return True
+        return img2pdf.convert(page_jpegs)
     except Exception as e:
         print(f"Error creating PDF from images: {e}")
-        return False
+        return None
 
 def resize_to_exact_size(input_path, output_path, target_size_mb=1.0):
-    """Resize PDF to exact target size using precise binary search"""
+    """Resize PDF to exact target size using a calibrated, model-guided quality search"""
     input_size = get_size_mb(input_path)
     print(f"Input file size: {input_size:.2f} MB")
     
     if input_size <= target_size_mb:
         print(f"File is already smaller than {target_size_mb} MB")
-        shutil.copy(input_path, output_path)
+        copy_file(input_path, output_path)
         return True
     
     # Create temp directory for working files
     temp_dir = tempfile.mkdtemp()
-    temp_output = os.path.join(temp_dir, "output.pdf")
+    pool = None
     
     try:
-        # First try simple compression with PyPDF2
-        reader = PdfReader(input_path)
-        writer = PdfWriter()
-        
-        for page in reader.pages:
-            writer.add_page(page)
-        
-        if reader.metadata:
-            writer.add_metadata(reader.metadata)
-        
-        with open(temp_output, 'wb') as f:
-            writer.write(f)
+        # First try simple lossless compression; the result stays in
+        # memory and only reaches disk if it is the result
+        simple_pdf = compress_pdf(input_path)
         
-        simple_size = get_size_mb(temp_output)
+        simple_size = len(simple_pdf) / (1024 * 1024)
         print(f"Basic compression result: {simple_size:.2f} MB")
         
         # If already within 5% of target size, we're done
         if 0.95 * target_size_mb <= simple_size <= 1.05 * target_size_mb:
-            shutil.copy(temp_output, output_path)
+            write_file(output_path, simple_pdf)
             print(f"Basic compression achieved target size: {simple_size:.2f} MB")
             return True
         
-        # If still too large, use image conversion with binary search
+        # If still too large, use image conversion with a model-guided quality search
         if simple_size > target_size_mb:
             # Extract images
             print("Converting PDF to images...")
@@ -141,81 +264,109 @@ def resize_to_exact_size(input_path, output_path, target_size_mb=1.0):
             
             print(f"Converted {len(image_files)} pages to images")
             
-            # Binary search for exact size
-            min_quality = 1
-            max_quality = 100
-            best_quality = 50
-            best_diff = float('inf')
-            iterations = 0
-            max_iterations = 10
+            # Repeated pages share an image file; encode each distinct one once
+            unique_files = list(dict.fromkeys(image_files))
+            unique_index = {img_path: i for i, img_path in enumerate(unique_files)}
+            page_order = [unique_index[img_path] for img_path in image_files]
+            if len(unique_files) < len(image_files):
+                print(f"  {len(image_files) - len(unique_files)} duplicate pages will reuse encodings")
             
-            # Keep track of best result
-            best_output = None
+            # Encode pages in parallel; workers reload the raw pages per
+            # trial so each trial is a single JPEG encode per page
+            workers = min(os.cpu_count() or 1, len(unique_files))
+            chunksize = max(1, len(unique_files) // (4 * workers))
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_encoder,
+                                       initargs=(unique_files,))
             
-            while min_quality <= max_quality and iterations < max_iterations:
-                iterations += 1
-                current_quality = (min_quality + max_quality) // 2
-                print(f"Trying quality: {current_quality} (iteration {iterations}/{max_iterations})")
-                
-                # Create temp output for this quality
-                iter_output = os.path.join(temp_dir, f"output_q{current_quality}.pdf")
-                
-                # Compress images with current quality
-                temp_images_dir = os.path.join(temp_dir, f"images_q{current_quality}")
-                os.makedirs(temp_images_dir, exist_ok=True)
-                
-                # Copy and compress images
-                temp_images = []
-                for i, img_path in enumerate(image_files):
-                    new_path = os.path.join(temp_images_dir, f"page_{i+1:03d}.jpg")
-                    try:
-                        img = Image.open(img_path)
-                        img.save(new_path, "JPEG", quality=current_quality)
-                        temp_images.append(new_path)
-                    except Exception as e:
-                        print(f"Error processing image: {e}")
-                
-                # Create PDF from compressed images
-                if not create_pdf_from_images(temp_images, iter_output):
+            # Calibrate a size model on an evenly spaced sample of pages;
+            # the quality search itself is arithmetic on the predictions
+            print("Calibrating size model...")
+            sample = sample_pages(page_order, CALIBRATION_SAMPLE_SIZE)
+            distinct_sample = list(dict.fromkeys(sample))
+            
+            # quality -> {page index: JPEG bytes}; calibration encodes are
+            # kept so building a PDF at a calibrated quality reuses them
+            encoded_pages = {}
+            
+            def sample_size(quality):
+                tasks = [(i, quality) for i in distinct_sample]
+                pages = encoded_pages.setdefault(quality, {})
+                pages.update(zip(distinct_sample, pool.map(_encode_page, tasks)))
+                return sum(len(pages[i]) for i in sample)
+            
+            points = [(quality, sample_size(quality)) for quality in CALIBRATION_QUALITIES]
+            min_quality = CALIBRATION_QUALITIES[0]
+            max_quality = CALIBRATION_QUALITIES[-1]
+            
+            def predict_size_mb(quality):
+                return predict_pdf_size_mb(points, len(sample), len(page_order), quality)
+            
+            quality = predicted_quality(predict_size_mb, target_size_mb, min_quality, max_quality)
+            
+            # One more calibration point at the predicted quality tightens
+            # the model where it matters
+            if quality not in CALIBRATION_QUALITIES:
+                points = sorted(points + [(quality, sample_size(quality))])
+                quality = predicted_quality(predict_size_mb, target_size_mb,
+                                            min_quality, max_quality)
+            
+            def build_pdf(quality):
+                pages = encoded_pages.setdefault(quality, {})
+                missing = [i for i in range(len(unique_files)) if i not in pages]
+                tasks = [(i, quality) for i in missing]
+                pages.update(zip(missing, pool.map(_encode_page, tasks, chunksize=chunksize)))
+                return create_pdf_from_images([pages[i] for i in page_order])
+            
+            # One full encode at the predicted quality, plus at most one
+            # correction trial using the measured error
+            best_quality = None
+            best_pdf = None
+            best_diff = float('inf')
+            
+            for _ in range(2):
+                print(f"Trying quality: {quality} (predicted {predict_size_mb(quality):.3f} MB)")
+                pdf_bytes = build_pdf(quality)
+                if pdf_bytes is None:
                     print("Failed to create PDF from compressed images")
-                    continue
+                    break
                 
-                # Check size
-                current_size = get_size_mb(iter_output)
+                current_size = len(pdf_bytes) / (1024 * 1024)
                 current_diff = abs(current_size - target_size_mb)
+                print(f"  Quality {quality} resulted in {current_size:.3f} MB (diff: {current_diff:.3f} MB)")
                 
-                print(f"  Quality {current_quality} resulted in {current_size:.3f} MB (diff: {current_diff:.3f} MB)")
-                
-                # Check if this is our best result so far
                 if current_diff < best_diff:
                     best_diff = current_diff
-                    best_quality = current_quality
-                    best_output = iter_output
-                    
-                    # If we're close enough (within 1%), we're done
-                    if current_diff < 0.01 * target_size_mb:
-                        print(f"Found sufficiently close result: {current_size:.3f} MB")
-                        break
+                    best_quality = quality
+                    best_pdf = pdf_bytes
+                
+                # If we're close enough (within 1%), we're done
+                if current_diff < 0.01 * target_size_mb:
+                    print(f"Found sufficiently close result: {current_size:.3f} MB")
+                    break
                 
-                # Adjust search range
-                if current_size > target_size_mb:
-                    max_quality = current_quality - 1
-                else:
-                    min_quality = current_quality + 1
+                # Rescale the prediction by the measured error and retry once
+                scale = current_size / predict_size_mb(quality)
+                corrected = predicted_quality(lambda q: scale * predict_size_mb(q),
+                                              target_size_mb, min_quality, max_quality)
+                if corrected == quality:
+                    break
+                quality = corrected
             
-            # Copy best result to output
-            if best_output and os.path.exists(best_output):
-                shutil.copy(best_output, output_path)
+            # Write best result to output
+            if best_pdf is not None:
+                write_file(output_path, best_pdf)
                 print(f"Best quality found: {best_quality}")
                 final_size = get_size_mb(output_path)
                 print(f"Final size: {final_size:.3f} MB (target: {target_size_mb:.1f} MB)")
+                if best_quality == min_quality and final_size > target_size_mb:
+                    print("Warning: Could not achieve target size even at the lowest quality")
                 return True
             else:
                 print("Failed to find suitable quality setting")
                 return False
         else:
-            # Already smaller than target, just copy
-            shutil.copy(temp_output, output_path)
+            # Already smaller than target, just write it out
+            write_file(output_path, simple_pdf)
             return True
             
     except Exception as e:
@@ -223,6 +374,8 @@ def resize_to_exact_size(input_path, output_path, target_size_mb=1.0):
         return False
     finally:
         # Clean up
+        if pool is not None:
+            pool.shutdown()
         try:
             shutil.rmtree(temp_dir)
         except: